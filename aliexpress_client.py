@@ -1,20 +1,44 @@
 from __future__ import annotations
 
 import hashlib
+import heapq
 import hmac
 import json
 import logging
 import random
+import re
+import threading
 import time
-from dataclasses import dataclass
-from datetime import datetime
-from typing import Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
+
+try:
+	import orjson
+except ImportError:  # optional speedup; stdlib json is used as fallback
+	orjson = None
 
 
 logger = logging.getLogger(__name__)
 
+LINK_CACHE_MAX = 4096
+LINK_CACHE_TTL = 24 * 3600.0
+
+
+def _json_dumps(obj: object) -> str:
+	if orjson is not None:
+		return orjson.dumps(obj).decode()
+	return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def _json_loads(raw: bytes) -> object:
+	if orjson is not None:
+		return orjson.loads(raw)
+	return json.loads(raw)
+
 
 ACCEPTED_CATEGORIES = {
 	"electronics",
@@ -32,8 +56,23 @@ ACCEPTED_CATEGORIES = {
 	"funko",
 }
 
+# Single-pass matcher for ACCEPTED_CATEGORIES (longest phrases first);
+# matched against Offer.searchable, which is already lowercased
+_CATEGORY_RE = re.compile(
+	"|".join(re.escape(c) for c in sorted(ACCEPTED_CATEGORIES, key=len, reverse=True))
+)
+_IMG_SIZE_RE = re.compile(r"_640x640\.jpg")
+# Only these hosts are trusted for post images
+_IMAGE_HOSTS = ("alicdn.com", "aliexpress")
 
-@dataclass
+# Query-string markers of URLs that are already affiliate/promotion links
+_AFF_MARKERS_RE = re.compile("|".join(["aff_", "affid", "affd", "ali_trackid", "pdp_npi"]))
+
+# Whole-word categories can be checked with a set intersection before the regex
+_CATEGORY_TOKENS = frozenset(c for c in ACCEPTED_CATEGORIES if " " not in c)
+
+
+@dataclass(slots=True, frozen=True)
 class Offer:
 	product_id: str
 	title: str
@@ -47,14 +86,30 @@ class Offer:
 	image_url: str
 	product_url: str
 	category: str
+	# lowercased "title category", shared by category filter and hashtags
+	searchable: str = field(init=False, repr=False, compare=False)
+
+	def __post_init__(self) -> None:
+		object.__setattr__(self, "searchable", f"{self.title} {self.category}".lower())
 
 
 class AliExpressClient:
 	def __init__(self, app_key: str, app_secret: str, tracking_id: str) -> None:
 		self.app_key = app_key
 		self.app_secret = app_secret
+		self._secret_bytes = app_secret.encode()
 		self.tracking_id = tracking_id
 		self.base_url = "https://api-sg.aliexpress.com/sync"  # Union Open Platform (SG endpoint)
+		# keep-alive pool so repeated API calls reuse the TLS connection
+		self._session = requests.Session()
+		self._session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=8))
+		# product_url -> (expires_at, affiliate link) for links produced by the API
+		self._link_cache: Dict[str, Tuple[float, str]] = {}
+		# callers reach generate_affiliate_link from worker threads (asyncio.to_thread)
+		self._link_cache_lock = threading.Lock()
+
+	def close(self) -> None:
+		self._session.close()
 
 	def _score(self, offer: Offer) -> float:
 		score = 0.0
@@ -68,16 +123,19 @@ class AliExpressClient:
 		return score
 
 	def _passes_category(self, offer: Offer) -> bool:
-		name = f"{offer.title} {offer.category}".lower()
-		return any(cat in name for cat in ACCEPTED_CATEGORIES)
+		name = offer.searchable
+		if not _CATEGORY_TOKENS.isdisjoint(name.split()):
+			return True
+		# multi-word phrases and substring hits (e.g. "gabinetes" inside a word)
+		return _CATEGORY_RE.search(name) is not None
 
 	def _affiliate(self, url: str) -> str:
 		sep = "&" if "?" in url else "?"
 		return f"{url}{sep}utm_source=telegram&utm_medium=bot&utm_campaign={self.tracking_id}"
 
 	def _shorten(self, url: str) -> str:
-		# simple deterministic shortener
-		h = hashlib.sha256(url.encode()).hexdigest()[:8]
+		# simple deterministic shortener (4-byte blake2b -> 8 hex chars)
+		h = hashlib.blake2b(url.encode(), digest_size=4).hexdigest()
 		return f"https://sjp.li/{h}"
 
 	def _available(self, offer: Offer) -> bool:
@@ -97,9 +155,9 @@ class AliExpressClient:
 				try:
 					product_id = str(it.get("product_id") or it.get("item_id") or it.get("app_sale_price_id") or "")
 					title = it.get("product_title") or it.get("title") or "Produto AliExpress"
-					image_url = (it.get("product_main_image_url") or it.get("image_url") or "").replace("_640x640.jpg", "_Q90.jpg")
+					image_url = _IMG_SIZE_RE.sub("_Q90.jpg", it.get("product_main_image_url") or it.get("image_url") or "")
 					# Only accept AliExpress CDN images; otherwise, leave empty to post text-only
-					if image_url and not ("alicdn.com" in image_url or "aliexpress" in image_url):
+					if image_url and not any(h in image_url for h in _IMAGE_HOSTS):
 						image_url = ""
 					# Prices
 					price_str = str(it.get("target_sale_price") or it.get("sale_price") or it.get("app_sale_price") or "0").replace(",", ".")
@@ -144,20 +202,41 @@ class AliExpressClient:
 
 	def generate_affiliate_link(self, offer: Offer) -> str:
 		# If API already returned a promotional/affiliated URL, use it directly
-		if any(x in (offer.product_url or "") for x in ["aff_", "affid", "aff_fcid", "aff_fsk", "aff_fcid", "aff_short_key", "affd", "ali_trackid", "pdp_npi"]):
+		if _AFF_MARKERS_RE.search(offer.product_url or ""):
 			return offer.product_url
+		now = time.monotonic()
+		with self._link_cache_lock:
+			cached = self._link_cache.get(offer.product_url)
+		if cached and cached[0] > now:
+			return cached[1]
+		link = None
 		try:
 			link = self._api_link_generate(offer.product_url)
-			if link:
-				return link
 		except Exception:
 			logger.exception("Failed to generate affiliate link via API; using fallback short link")
+		if link:
+			with self._link_cache_lock:
+				# a refreshed (expired) key moves to the newest slot instead of evicting another
+				self._link_cache.pop(offer.product_url, None)
+				if len(self._link_cache) >= LINK_CACHE_MAX:
+					# drop the oldest entry (dicts keep insertion order)
+					self._link_cache.pop(next(iter(self._link_cache)), None)
+				self._link_cache[offer.product_url] = (now + LINK_CACHE_TTL, link)
+			return link
 		return self._shorten(self._affiliate(offer.product_url))
 
 	def best_scored(self, limit: int = 25) -> List[Offer]:
+		# single ranking path shared with stream_scored
+		return list(self.stream_scored(limit))
+
+	def stream_scored(self, limit: int = 25) -> Iterator[Offer]:
+		"""Yield up to `limit` offers best-first, ordering them lazily."""
 		offers = [o for o in self.fetch_top_offers(limit * 3) if self._passes_category(o)]
-		offers.sort(key=self._score, reverse=True)
-		return offers[:limit]
+		# index breaks score ties in fetch order
+		heap = [(-self._score(o), i, o) for i, o in enumerate(offers)]
+		heapq.heapify(heap)
+		for _ in range(min(limit, len(heap))):
+			yield heapq.heappop(heap)[2]
 
 	# ---- Mock data generator ----
 	def _mock_offers(self, limit: int) -> List[Offer]:
@@ -169,17 +248,19 @@ class AliExpressClient:
 			("Funko Pop Colecionável", "funko"),
 			("Luminária LED de Mesa", "decoracao"),
 		]
+		# draw each categorical column in one batch instead of per offer
+		products = random.choices(base_products, k=limit)
+		discounts = random.choices([10, 20, 30, 40, 50], k=limit)
+		coupons = random.choices([None, "R$20 OFF", "R$50 OFF", None], k=limit)
+		shipping = random.choices([True, False], k=limit)
+		stamp = int(time.time())
 		offers: List[Offer] = []
-		for i in range(limit):
-			title, category = random.choice(base_products)
+		for i, ((title, category), discount_pct, coupon, free_shipping) in enumerate(zip(products, discounts, coupons, shipping)):
 			old_price = round(random.uniform(150.0, 1500.0), 2)
-			discount_pct = random.choice([10, 20, 30, 40, 50])
 			price = round(old_price * (1 - discount_pct / 100.0), 2)
-			coupon = random.choice([None, "R$20 OFF", "R$50 OFF", None])
-			free_shipping = random.choice([True, False])
 			sales = random.randint(5, 500)
 			rating = round(random.uniform(3.5, 4.9), 1)
-			pid = f"mock-{int(time.time())}-{i}-{random.randint(100,999)}"
+			pid = f"mock-{stamp}-{i}-{random.randint(100,999)}"
 			offers.append(
 				Offer(
 					product_id=pid,
@@ -201,26 +282,32 @@ class AliExpressClient:
 	# ---- Real API helpers ----
 	def _top_sign(self, params: Dict[str, str]) -> str:
 		# TOP-style HMAC-MD5 signature: sign = MD5(secret + concat(kv) + secret)
-		joined = "".join(f"{k}{params[k]}" for k in sorted(params.keys()))
-		data = (self.app_secret + joined + self.app_secret).encode()
-		return hashlib.md5(data).hexdigest().upper()
+		buf = bytearray(self._secret_bytes)
+		for k, v in sorted(params.items()):
+			buf += k.encode()
+			buf += str(v).encode()
+		buf += self._secret_bytes
+		return hashlib.md5(buf).hexdigest().upper()
 
 	def _api_call(self, method: str, biz_params: Dict[str, object]) -> Dict[str, object]:
+		t = time.gmtime()
 		common = {
 			"app_key": self.app_key,
 			"method": method,
 			"sign_method": "md5",
-			"timestamp": datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S"),
+			"timestamp": f"{t.tm_year:04d}-{t.tm_mon:02d}-{t.tm_mday:02d} {t.tm_hour:02d}:{t.tm_min:02d}:{t.tm_sec:02d}",
 			"format": "json",
 			"v": "2.0",
 		}
-		payload = {**common, "param": json.dumps(biz_params, ensure_ascii=False)}
+		payload = {**common, "param": _json_dumps(biz_params)}
 		payload["sign"] = self._top_sign(payload)
 		logger.info("AliExpress API call %s with params=%s", method, biz_params)
-		resp = requests.post(self.base_url, data=payload, timeout=15)
+		resp = self._session.post(self.base_url, data=payload, timeout=15)
 		resp.raise_for_status()
-		data = resp.json()
-		logger.info("AliExpress API response %s: %s", method, str(data)[:800])
+		raw = resp.content
+		data = _json_loads(raw)
+		# log the raw body prefix; str(data) would re-walk the whole parsed tree
+		logger.info("AliExpress API response %s: %s", method, raw[:800].decode("utf-8", "replace"))
 		return data
 
 	def _api_product_query(self, limit: int) -> List[Dict[str, object]]:
@@ -228,44 +315,48 @@ class AliExpressClient:
 		keywords = [
 			"RTX", "Ryzen", "Gabinete", "Teclado Mecânico", "Funko", "LED"
 		]
+		# Keywords are independent; run them concurrently over the pooled session
 		result_items: List[Dict[str, object]] = []
-		for kw in keywords:
-			try:
-				res = self._api_call(
-					"aliexpress.affiliate.product.query",
-					{
-						"keywords": kw,
-						"target_language": "pt_BR",
-						"target_currency": "BRL",
-						"page_size": 20,
-						"sort": "SALE_PRICE_ASC",
-					},
-				)
-				# Response shape can vary; try common paths
-				data = (
-					res.get("aliexpress_affiliate_product_query_response")
-					or res.get("resp")
-					or res
-				)
-				items = (
-					(data or {}).get("result")
-					or (data or {}).get("products")
-					or {}
-				)
-				products = items.get("products") if isinstance(items, dict) else items
-				if isinstance(products, list):
-					result_items.extend(products)
-			except Exception:
-				logger.warning("Product query failed for '%s'", kw)
-		# De-dup by product_id
-		seen = set()
-		unique: List[Dict[str, object]] = []
+		with ThreadPoolExecutor(max_workers=len(keywords)) as pool:
+			for products in pool.map(self._query_keyword, keywords):
+				result_items.extend(products)
+		# De-dup by product_id; dicts keep insertion order, first occurrence wins
+		unique: Dict[str, Dict[str, object]] = {}
 		for it in result_items:
 			pid = str(it.get("product_id") or it.get("item_id") or "")
-			if pid and pid not in seen:
-				unique.append(it)
-				seen.add(pid)
-		return unique[:limit]
+			if pid:
+				unique.setdefault(pid, it)
+		return list(unique.values())[:limit]
+
+	def _query_keyword(self, kw: str) -> List[Dict[str, object]]:
+		try:
+			res = self._api_call(
+				"aliexpress.affiliate.product.query",
+				{
+					"keywords": kw,
+					"target_language": "pt_BR",
+					"target_currency": "BRL",
+					"page_size": 20,
+					"sort": "SALE_PRICE_ASC",
+				},
+			)
+			# Response shape can vary; try common paths
+			data = (
+				res.get("aliexpress_affiliate_product_query_response")
+				or res.get("resp")
+				or res
+			)
+			items = (
+				(data or {}).get("result")
+				or (data or {}).get("products")
+				or {}
+			)
+			products = items.get("products") if isinstance(items, dict) else items
+			if isinstance(products, list):
+				return products
+		except Exception:
+			logger.warning("Product query failed for '%s'", kw)
+		return []
 
 	def _api_link_generate(self, url: str) -> Optional[str]:
 		res = self._api_call(
@@ -88,7 +88,8 @@ class BotCore:
 		async def postnow_handler(message: Message) -> None:
 			if not self._is_admin(message.from_user.id if message.from_user else 0):
 				return
-			offers = self.ali.best_scored(limit=20)
+			# AliExpress calls are blocking HTTP; keep the dispatcher loop free
+			offers = await asyncio.to_thread(self.ali.best_scored, 20)
 			for offer in offers:
 				ok = await self.post_offer(offer)
 				if ok:
@@ -107,7 +108,8 @@ class BotCore:
 		if self.db.posted_within(offer.product_id, since):
 			return False
 
-		caption = format_offer_message(offer, self.ali.generate_affiliate_link(offer))
+		link = await asyncio.to_thread(self.ali.generate_affiliate_link, offer)
+		caption = format_offer_message(offer, link)
 		try:
 			if self.send_enabled:
 				if offer.image_url:
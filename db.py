@@ -1,12 +1,14 @@
 import sqlite3
+import threading
 from dataclasses import dataclass
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Iterable, List, Optional, Tuple
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
 
 
 SCHEMA_SQL = """
 PRAGMA journal_mode=WAL;
+PRAGMA synchronous=NORMAL;
 CREATE TABLE IF NOT EXISTS posts (
   id INTEGER PRIMARY KEY AUTOINCREMENT,
   product_id TEXT NOT NULL,
@@ -36,72 +38,119 @@ CREATE TABLE IF NOT EXISTS clicks (
 );
 """
 
+INSERT_POST_SQL = "INSERT OR IGNORE INTO posts(product_id, posted_at, price, coupon) VALUES (?, ?, ?, ?)"
+POSTED_WITHIN_SQL = "SELECT 1 FROM posts WHERE product_id=? AND posted_at>=? LIMIT 1"
+
 
 class Database:
     def __init__(self, path: str) -> None:
         Path(path).parent.mkdir(parents=True, exist_ok=True)
         self._conn = sqlite3.connect(path, check_same_thread=False)
+        # the connection is shared by the event loop and worker threads
+        # (asyncio.to_thread, APScheduler's pool); serialize access to it
+        self._lock = threading.Lock()
         self._conn.execute("PRAGMA foreign_keys = ON;")
         self._conn.executescript(SCHEMA_SQL)
         self._conn.commit()
+        # write-through cache of the state table; None marks a missing key
+        self._state_cache: Dict[str, Optional[str]] = {}
 
     def close(self) -> None:
-        self._conn.close()
+        with self._lock:
+            self._conn.close()
 
     # Posts
     def record_post(self, product_id: str, posted_at: datetime, price: float, coupon: Optional[str]) -> None:
-        self._conn.execute(
-            "INSERT OR IGNORE INTO posts(product_id, posted_at, price, coupon) VALUES (?, ?, ?, ?)",
-            (product_id, posted_at.isoformat(), price, coupon or None),
-        )
-        self._conn.commit()
+        with self._lock:
+            self._conn.execute(
+                INSERT_POST_SQL,
+                (product_id, posted_at.isoformat(), price, coupon or None),
+            )
+            self._conn.commit()
+
+    def record_posts(self, rows: Iterable[Tuple[str, datetime, float, Optional[str]]]) -> None:
+        # one transaction (one WAL sync) for the whole batch
+        with self._lock, self._conn:
+            self._conn.executemany(
+                INSERT_POST_SQL,
+                ((pid, ts.isoformat(), price, coupon or None) for pid, ts, price, coupon in rows),
+            )
 
     def posted_within(self, product_id: str, since: datetime) -> bool:
-        cur = self._conn.execute(
-            "SELECT 1 FROM posts WHERE product_id=? AND posted_at>=? LIMIT 1",
-            (product_id, since.isoformat()),
-        )
-        return cur.fetchone() is not None
+        with self._lock:
+            cur = self._conn.execute(
+                POSTED_WITHIN_SQL,
+                (product_id, since.isoformat()),
+            )
+            return cur.fetchone() is not None
 
     def get_recent_posts(self, limit: int = 10) -> List[Tuple[str, str, Optional[float]]]:
-        cur = self._conn.execute(
-            "SELECT product_id, posted_at, price FROM posts ORDER BY posted_at DESC LIMIT ?",
-            (limit,),
-        )
-        return list(cur.fetchall())
+        with self._lock:
+            cur = self._conn.execute(
+                "SELECT product_id, posted_at, price FROM posts ORDER BY posted_at DESC LIMIT ?",
+                (limit,),
+            )
+            return list(cur.fetchall())
 
     # Counters
     def get_counter(self, key: str) -> int:
-        cur = self._conn.execute("SELECT value FROM counters WHERE key=?", (key,))
-        row = cur.fetchone()
+        with self._lock:
+            cur = self._conn.execute("SELECT value FROM counters WHERE key=?", (key,))
+            row = cur.fetchone()
         return int(row[0]) if row else 0
 
     def set_counter(self, key: str, value: int) -> None:
-        self._conn.execute(
-            "INSERT INTO counters(key, value) VALUES(?, ?) ON CONFLICT(key) DO UPDATE SET value=excluded.value",
-            (key, value),
-        )
-        self._conn.commit()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO counters(key, value) VALUES(?, ?) ON CONFLICT(key) DO UPDATE SET value=excluded.value",
+                (key, value),
+            )
+            self._conn.commit()
 
     # State
     def get_state(self, key: str, default: Optional[str] = None) -> Optional[str]:
-        cur = self._conn.execute("SELECT value FROM state WHERE key=?", (key,))
-        row = cur.fetchone()
-        return row[0] if row else default
+        if key in self._state_cache:
+            value = self._state_cache[key]
+        else:
+            # fill under the lock so a concurrent set_state cannot be overwritten
+            with self._lock:
+                if key not in self._state_cache:
+                    cur = self._conn.execute("SELECT value FROM state WHERE key=?", (key,))
+                    row = cur.fetchone()
+                    self._state_cache[key] = row[0] if row else None
+                value = self._state_cache[key]
+        return value if value is not None else default
+
+    def get_states(self, keys: Sequence[str]) -> Dict[str, str]:
+        # one IN (...) query for whichever keys are not cached yet
+        missing = [k for k in keys if k not in self._state_cache]
+        if missing:
+            with self._lock:
+                missing = [k for k in missing if k not in self._state_cache]
+                if missing:
+                    placeholders = ",".join("?" * len(missing))
+                    cur = self._conn.execute(f"SELECT key, value FROM state WHERE key IN ({placeholders})", missing)
+                    found = dict(cur.fetchall())
+                    for k in missing:
+                        self._state_cache[k] = found.get(k)
+        return {k: self._state_cache[k] for k in keys if self._state_cache[k] is not None}
 
     def set_state(self, key: str, value: str) -> None:
-        self._conn.execute(
-            "INSERT INTO state(key, value) VALUES(?, ?) ON CONFLICT(key) DO UPDATE SET value=excluded.value",
-            (key, value),
-        )
-        self._conn.commit()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO state(key, value) VALUES(?, ?) ON CONFLICT(key) DO UPDATE SET value=excluded.value",
+                (key, value),
+            )
+            self._conn.commit()
+            self._state_cache[key] = value
 
     # Click metrics (placeholder)
     def record_click(self, product_id: str, ts: datetime) -> None:
-        self._conn.execute(
-            "INSERT INTO clicks(product_id, clicked_at) VALUES (?, ?)",
-            (product_id, ts.isoformat()),
-        )
-        self._conn.commit()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO clicks(product_id, clicked_at) VALUES (?, ?)",
+                (product_id, ts.isoformat()),
+            )
+            self._conn.commit()
 
 
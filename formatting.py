@@ -1,11 +1,32 @@
 from __future__ import annotations
 
+import re
 from dataclasses import dataclass
 from typing import Optional
 
 from aliexpress_client import Offer
 
 
+_HTML_TRANS = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;"})
+# swaps "," and "." atomically: 1,234.56 -> 1.234,56
+_BRL_SWAP = str.maketrans(",.", ".,")
+
+BASE_HASHTAGS = ["#Promo", "#Desconto", "#AliExpress", "#Ofertas"]
+# (substring, hashtag) in output order
+CATEGORY_HASHTAGS = [
+	("placa", "#PCGamer"),
+	("ryzen", "#Processadores"),
+	("gabinete", "#Gabinetes"),
+	("gamer", "#Gamer"),
+	("funko", "#FunkoPop"),
+	("led", "#DecoTech"),
+]
+# Zero-width lookahead so overlapping keywords are all reported in one scan
+_HASHTAG_RE = re.compile(
+	"(?=" + "|".join(f"(?P<t{i}>{re.escape(sub)})" for i, (sub, _) in enumerate(CATEGORY_HASHTAGS)) + ")"
+)
+
+
 def format_offer_message(offer: Offer, affiliate_link: str) -> str:
 	highlight_parts = []
 	if offer.coupon:
@@ -14,8 +35,8 @@ def format_offer_message(offer: Offer, affiliate_link: str) -> str:
 		highlight_parts.append("Frete Grátis")
 	highlight = " | ".join(highlight_parts) if highlight_parts else "Oferta"
 
-	old_str = f"R$ {offer.old_price:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
-	new_str = f"R$ {offer.price:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+	old_str = format_brl(offer.old_price)
+	new_str = format_brl(offer.price)
 
 	# Using HTML parse mode (Telegram)
 	text = (
@@ -33,28 +54,17 @@ def format_offer_message(offer: Offer, affiliate_link: str) -> str:
 	return text
 
 
+def format_brl(value: float) -> str:
+	return f"R$ {value:,.2f}".translate(_BRL_SWAP)
+
+
 def escape_html(s: str) -> str:
-	return (
-		s.replace("&", "&amp;")
-		.replace("<", "&lt;")
-		.replace(">", "&gt;")
-	)
+	return s.translate(_HTML_TRANS)
 
 
 def hashtags_line(offer: Offer) -> str:
-	base = ["#Promo", "#Desconto", "#AliExpress", "#Ofertas"]
-	cats = []
-	name = f"{offer.title} {offer.category}".lower()
-	for tag in [
-		("placa", "#PCGamer"),
-		("ryzen", "#Processadores"),
-		("gabinete", "#Gabinetes"),
-		("gamer", "#Gamer"),
-		("funko", "#FunkoPop"),
-		("led", "#DecoTech"),
-	]:
-		if tag[0] in name:
-			cats.append(tag[1])
-	return " ".join(base + cats)
+	found = {m.lastgroup for m in _HASHTAG_RE.finditer(offer.searchable)}
+	cats = [tag for i, (_, tag) in enumerate(CATEGORY_HASHTAGS) if f"t{i}" in found]
+	return " ".join(BASE_HASHTAGS + cats)
 
 
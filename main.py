@@ -25,6 +25,8 @@ async def main() -> None:
     try:
         await core.dp.start_polling(core.bot)
     finally:
+        await sched.stop()
+        ali.close()
         db.close()
 
 
@@ -2,14 +2,19 @@ from __future__ import annotations
 
 import asyncio
 import logging
+import math
 import random
-from datetime import datetime, timedelta
-from typing import List
-
+import time
+from collections import deque
+from datetime import datetime
+from itertools import islice
+from typing import Deque, Dict, List, Optional, Set
+
+from apscheduler.executors.asyncio import AsyncIOExecutor
+from apscheduler.executors.pool import ThreadPoolExecutor
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
-from apscheduler.triggers.date import DateTrigger
 
-from aliexpress_client import AliExpressClient
+from aliexpress_client import AliExpressClient, Offer
 from bot_core import BotCore
 from config import Settings
 from db import Database
@@ -17,6 +22,13 @@ from db import Database
 
 logger = logging.getLogger(__name__)
 
+# prefetched, ranked and availability-checked offers kept for _post_one
+READY_MAXLEN = 64
+# local hours in which posts are planned (06:00-22:00)
+POST_WINDOW = range(6, 22)
+# seconds stop() lets in-flight posts finish before cancelling them
+STOP_TIMEOUT = 30.0
+
 
 class PostingScheduler:
     def __init__(self, settings: Settings, db: Database, ali: AliExpressClient, core: BotCore) -> None:
@@ -24,66 +36,174 @@ class PostingScheduler:
         self.db = db
         self.ali = ali
         self.core = core
-        self.scheduler = AsyncIOScheduler(timezone=settings.timezone)
-        self.consecutive_failures = 0
+        self._tz = settings.timezone
+        # coroutine jobs run on the loop; sync planning gets its own small pool
+        self._plan_pool = ThreadPoolExecutor(2)
+        self.scheduler = AsyncIOScheduler(
+            timezone=self._tz,
+            executors={"default": AsyncIOExecutor(), "sync": self._plan_pool},
+        )
+        self._ready: Deque[Offer] = deque(maxlen=READY_MAXLEN)
+        # intra-hour posts are plain loop timers; only planning uses APScheduler
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # keyed by planned epoch second so re-planning the same instant arms it only once
+        self._pending: Dict[int, asyncio.TimerHandle] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._post_lock = asyncio.Lock()
 
     def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
         self.scheduler.start()
+        # keep the ready queue warm; runs once right away
+        self.scheduler.add_job(self._refresh_ready, "cron", minute="*/5", next_run_time=datetime.now(self._tz))
         # schedule hourly at minute 0
-        self.scheduler.add_job(self._plan_next_hour, "cron", minute=0)
+        self.scheduler.add_job(self._plan_next_hour, "cron", minute=0, executor="sync")
         # plan immediately for current partial hour
-        self.scheduler.add_job(self._plan_next_hour, next_run_time=datetime.now(self.settings.timezone))
+        self.scheduler.add_job(self._plan_next_hour, next_run_time=datetime.now(self._tz), executor="sync")
+
+    async def stop(self) -> None:
+        # on the loop thread: AsyncIOExecutor cancels its running coroutine jobs
+        # (_refresh_ready, _probe_inventory) before they reach the db
+        self.scheduler.shutdown(wait=False)
+        # a _plan_next_hour on the "sync" pool may still be reading state; wait it out
+        # off the loop so the timers it hands to _arm_posts are armed before we cancel them
+        await asyncio.to_thread(self._plan_pool.shutdown, True)
+        for handle in self._pending.values():
+            handle.cancel()
+        self._pending.clear()
+        # let in-flight posts finish so send_message is never left without its
+        # record_post; only posts still stuck after STOP_TIMEOUT are cancelled
+        if self._tasks:
+            _, stuck = await asyncio.wait(set(self._tasks), timeout=STOP_TIMEOUT)
+            for task in stuck:
+                task.cancel()
+            await asyncio.gather(*stuck, return_exceptions=True)
+
+    def _is_paused(self) -> bool:
+        # served from Database's write-through state cache, not a sqlite query
+        return self.db.get_state("paused", "0") == "1"
 
     def _in_window(self, now: datetime) -> bool:
-        return 6 <= now.hour < 22
+        return now.hour in POST_WINDOW
 
-    def _get_hourly_bounds(self) -> (int, int):
-        mn = int(self.db.get_state("min_per_hour", str(self.settings.min_per_hour_default)))
-        mx = int(self.db.get_state("max_per_hour", str(self.settings.max_per_hour_default)))
+    def _get_hourly_bounds(self, state: Dict[str, str]) -> (int, int):
+        mn = int(state.get("min_per_hour", self.settings.min_per_hour_default))
+        mx = int(state.get("max_per_hour", self.settings.max_per_hour_default))
         if mx < mn:
             mx = mn
         return mn, mx
 
-    def _random_times_within_hour(self, now: datetime, n: int) -> List[datetime]:
-        start = now.replace(minute=0, second=0, microsecond=0)
-        end = start + timedelta(hours=1)
-        seconds = sorted(random.sample(range(0, 3600), k=min(n, 3600)))
-        return [start + timedelta(seconds=s) for s in seconds if now <= start + timedelta(seconds=s) < end]
+    def _random_times_within_hour(self, start: datetime, now: datetime, n: int, rng: random.Random) -> List[int]:
+        # returns sorted second offsets from `start`, skipping those already past
+        lo = math.ceil((now - start).total_seconds())
+        # sampling from a range object never materializes the 3600 ints; for
+        # small k, random.sample picks by set-based rejection
+        seconds = rng.sample(range(0, 3600), k=min(n, 3600))
+        seconds.sort()
+        return [s for s in seconds if s >= lo]
 
     def _plan_next_hour(self) -> None:
-        now = datetime.now(self.settings.timezone)
-        if self.db.get_state("paused", "0") == "1":
-            logger.info("Bot paused; skipping schedule plan")
-            return
+        now = datetime.now(self._tz)
+        # cheapest check first: outside the window nothing else matters
         if not self._in_window(now):
             logger.info("Outside posting window; skipping hour plan")
             return
+        state = self.db.get_states(("paused", "min_per_hour", "max_per_hour", "offers_available"))
+        if state.get("paused", "0") == "1":
+            logger.info("Bot paused; skipping schedule plan")
+            return
+        # written by _refresh_ready; absent until the first fetch
+        if state.get("offers_available") == "0":
+            logger.info("No offers available at last fetch; probing before planning")
+            self.scheduler.add_job(self._probe_inventory)
+            return
 
-        mn, mx = self._get_hourly_bounds()
-        n = random.randint(mn, mx)
+        mn, mx = self._get_hourly_bounds(state)
+        # seeded per hour: re-planning the same hour (restart, inventory probe)
+        # yields the same instants, which _arm_posts de-duplicates
+        hour_start = now.replace(minute=0, second=0, microsecond=0)
+        rng = random.Random(int(hour_start.timestamp()))
+        n = rng.randint(mn, mx)
         logger.info("Planning %s posts this hour", n)
-        for when in self._random_times_within_hour(now, n):
-            self.scheduler.add_job(self._post_one, trigger=DateTrigger(run_date=when))
+        offsets = self._random_times_within_hour(hour_start, now, n, rng)
+        # APScheduler runs this sync job in a worker thread; timers must be armed on the loop
+        self._loop.call_soon_threadsafe(self._arm_posts, int(hour_start.timestamp()), offsets)
+
+    def _arm_posts(self, start_ts: int, offsets: List[int]) -> None:
+        loop = self._loop
+        now_mono = loop.time()
+        # drop handles that already fired
+        self._pending = {t: h for t, h in self._pending.items() if h.when() > now_mono and not h.cancelled()}
+        wall_now = time.time()
+        for s in offsets:
+            when = start_ts + s
+            if when in self._pending:
+                continue
+            self._pending[when] = loop.call_later(max(0.0, when - wall_now), self._fire_post)
+
+    def _fire_post(self) -> None:
+        task = asyncio.create_task(self._post_one())
+        # hold a reference until done so the task is not garbage collected
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _bump_failures(self) -> int:
+        # persisted in the state table so the streak survives restarts
+        n = int(self.db.get_state("fail_count", "0")) + 1
+        self.db.set_state("fail_count", str(n))
+        return n
+
+    def _reset_failures(self) -> None:
+        if self.db.get_state("fail_count", "0") != "0":
+            self.db.set_state("fail_count", "0")
+
+    def _collect_ready(self) -> List[Offer]:
+        # blocking HTTP (ranking + availability), called via asyncio.to_thread;
+        # islice stops the lazy ranking once the queue would be full
+        available = (o for o in self.ali.stream_scored(limit=100) if self.ali._available(o))
+        return list(islice(available, READY_MAXLEN))
+
+    async def _refresh_ready(self, force: bool = False) -> bool:
+        if not force and (self._is_paused() or not self._in_window(datetime.now(self._tz))):
+            return bool(self._ready)
+        offers = await asyncio.to_thread(self._collect_ready)
+        # swapped on the loop thread, so _post_one never sees a partial queue
+        self._ready = deque(offers, maxlen=READY_MAXLEN)
+        self.db.set_state("offers_available", str(len(self._ready)))
+        return bool(offers)
+
+    async def _probe_inventory(self) -> None:
+        # refresh the offers_available counter; plan the rest of the hour if it recovered
+        if await self._refresh_ready(force=True):
+            # planning does blocking sqlite reads; keep it off the loop like the cron runs
+            self.scheduler.add_job(self._plan_next_hour, executor="sync")
 
     async def _post_one(self) -> None:
-        if self.db.get_state("paused", "0") == "1":
+        # one post at a time: overlapping fires would race on the queue and failure count
+        if self._post_lock.locked():
+            logger.info("Previous post still running; skipping this slot")
             return
-        # fetch best current offers
-        offers = self.ali.best_scored(limit=20)
+        async with self._post_lock:
+            await self._post_one_locked()
+
+    async def _post_one_locked(self) -> None:
+        if self._is_paused():
+            return
+        if not self._ready:
+            # slow path: queue drained before the next scheduled refresh
+            await self._refresh_ready(force=True)
         posted = False
-        for offer in offers:
-            if not self.ali._available(offer):
-                continue
-            if await self.core.post_offer(offer):
-                posted = True
-                break
+        while self._ready and not posted:
+            posted = await self.core.post_offer(self._ready.popleft())
         if not posted:
-            self.consecutive_failures += 1
-            logger.warning("No offer posted in this attempt. Failure count=%s", self.consecutive_failures)
-            if self.consecutive_failures >= 5:
+            failures = self._bump_failures()
+            logger.warning("No offer posted in this attempt. Failure count=%s", failures)
+            if failures >= 5:
                 self.db.set_state("paused", "1")
+                # start a fresh streak after /resume instead of re-pausing on the next miss
+                self._reset_failures()
                 await self.core.notify_admins("Bot pausado automaticamente após 5 falhas consecutivas de postagem.")
         else:
-            self.consecutive_failures = 0
+            self._reset_failures()
 
 
@@ -1,3 +1,4 @@
+import argparse
 import asyncio
 import logging
 from datetime import datetime, timedelta
@@ -9,6 +10,9 @@ from db import Database
 from logger import setup_logging
 
 
+SIMULATE_CONCURRENCY = 5
+
+
 async def simulate(n: int = 5) -> None:
 	settings = Settings.load()
 	setup_logging(settings.log_dir)
@@ -17,20 +21,45 @@ async def simulate(n: int = 5) -> None:
 	ali = AliExpressClient(settings.app_key, settings.app_secret, settings.tracking_id)
 	core = BotCore(settings, db, ali, send_enabled=False)
 
-	offers = ali.best_scored(limit=max(20, n * 3))
-	count = 0
-	for offer in offers:
-		ok = await core.post_offer(offer)
-		if ok:
-			count += 1
-		if count >= n:
-			break
+	try:
+		offers = await asyncio.to_thread(ali.best_scored, max(20, n * 3))
+		sem = asyncio.Semaphore(SIMULATE_CONCURRENCY)
+		count = 0
+		in_flight = 0
+
+		async def _one(offer) -> None:
+			nonlocal count, in_flight
+			async with sem:
+				# reserve a slot so concurrent posts never overshoot n
+				if count + in_flight >= n:
+					return
+				in_flight += 1
+				try:
+					if await core.post_offer(offer):
+						count += 1
+				finally:
+					in_flight -= 1
+
+		await asyncio.gather(*(_one(o) for o in offers))
+
+		logging.info("Simulation done. Posted %s offers.", count)
+	finally:
+		await core.bot.session.close()
+		ali.close()
+		db.close()
+
 
-	logging.info("Simulation done. Posted %s offers.", count)
-	db.close()
+async def _main(runs: int, n: int) -> None:
+	# one event loop for all runs
+	for _ in range(runs):
+		await simulate(n)
 
 
 if __name__ == "__main__":
-	asyncio.run(simulate())
+	parser = argparse.ArgumentParser(description="Simula postagens de uma hora (dry-run).")
+	parser.add_argument("-n", type=int, default=5, help="postagens por execução")
+	parser.add_argument("--runs", type=int, default=1, help="quantidade de execuções")
+	args = parser.parse_args()
+	asyncio.run(_main(args.runs, args.n))
 
 